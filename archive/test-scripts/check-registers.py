@@ -1,55 +1,273 @@
 #!/usr/bin/env python3
 
+import atexit
 import socket
-import struct
 import time
+from concurrent.futures import ThreadPoolExecutor
+from modbus_raw import REQ, U16, MAX_ADU_SIZE, register_struct, tune_socket, quickack, read_frame
 
-def read_modbus_registers(host, port, unit_id, start_reg, count):
-    """Read holding registers via Modbus TCP"""
-    try:
+# Modbus limits a single Read Holding Registers request to 125 registers
+MAX_REGISTERS_PER_READ = 125
+
+# Counter channels to report: (channel, name)
+CHANNELS = [
+    (0, "MainProductCounter"),
+    (1, "RejectCounter"),
+]
+
+def decode_registers(response):
+    """Extract register values from a Read Holding Registers response frame"""
+    # Exception responses carry an error code instead of register data
+    if len(response) < 9 or response[7] & 0x80:
+        return None
+
+    # Skip 7-byte header + function code + byte count; response is a
+    # memoryview, so slicing hands struct the payload without copying it
+    byte_count = response[8]
+    n = byte_count // 2
+    if len(response) < 9 + 2 * n:
+        return None
+    return list(register_struct(n).unpack(response[9:9 + 2 * n]))
+
+class ModbusConn:
+    """Persistent Modbus TCP connection to a single device"""
+
+    def __init__(self, host, port, timeout=3.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.transaction_id = 0
+        # One request frame per (unit, start, count), reused for every poll of that range
+        self.requests = {}
+        # Receive buffer reused for every response on this connection
+        self.rx = memoryview(bytearray(MAX_ADU_SIZE))
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        tune_socket(self.sock)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def read_registers(self, unit_id, start_reg, count):
+        """Read holding registers, re-dialling once if the connection has dropped"""
+        return self.read_many(unit_id, [(start_reg, count)])[0]
+
+    def read_many(self, unit_id, ranges):
+        """Read several (start_reg, count) ranges, re-dialling once if the connection has dropped.
+
+        Returns one list of register values (or None) per range, in order.
+        """
+        try:
+            return self._read_many(unit_id, ranges)
+        except OSError:
+            self.close()
+            return self._read_many(unit_id, ranges)
+
+    def _read_many(self, unit_id, ranges):
+        if self.sock is None:
+            self.connect()
+
+        # Pipeline: put every request on the wire before waiting for any reply.
+        # Replies are matched back to their range by transaction ID.
+        quickack(self.sock)
+        outstanding = {}
+        for index, (start_reg, count) in enumerate(ranges):
+            self._send_request(unit_id, start_reg, count)
+            outstanding[self.transaction_id] = index
+
+        # The whole pipelined batch shares one response budget
+        deadline = time.monotonic() + self.timeout
+        results = [None] * len(ranges)
+        while outstanding:
+            response = read_frame(self.sock, self.rx, deadline)
+            transaction_id = U16.unpack_from(response)[0]
+            if transaction_id not in outstanding:
+                raise ConnectionError(f"Unexpected transaction ID {transaction_id} in response")
+            results[outstanding.pop(transaction_id)] = decode_registers(response)
+        return results
+
+    def _send_request(self, unit_id, start_reg, count):
         # Create Modbus TCP request
-        transaction_id = 1
+        self.transaction_id = (self.transaction_id + 1) & 0xFFFF
         protocol_id = 0
         length = 6
         function_code = 3  # Read Holding Registers
-        
-        # Build request packet
-        request = struct.pack('>HHHBBHH', 
-                            transaction_id, protocol_id, length, 
-                            unit_id, function_code, start_reg, count)
-        
+
+        # Build request packet in place; a repeat poll of the same range only
+        # needs its transaction ID bumped
+        request = self.requests.get((unit_id, start_reg, count))
+        if request is None:
+            request = self.requests[(unit_id, start_reg, count)] = bytearray(REQ.size)
+            REQ.pack_into(request, 0, self.transaction_id, protocol_id, length,
+                           unit_id, function_code, start_reg, count)
+        else:
+            U16.pack_into(request, 0, self.transaction_id)
+
         # Send request
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(3.0)
-        sock.connect((host, port))
-        sock.send(request)
-        
-        # Read response
-        response = sock.recv(1024)
-        sock.close()
-        
-        # Parse response
-        if len(response) < 9:
-            return None
-            
-        # Extract register values (skip header)
-        reg_data = response[9:]  # Skip 7-byte header + 2-byte byte count
-        values = []
-        for i in range(0, len(reg_data), 2):
-            if i + 1 < len(reg_data):
-                val = struct.unpack('>H', reg_data[i:i+2])[0]
-                values.append(val)
-        
-        return values
-        
+        self.sock.send(request)
+
+# One connection per (host, port), shared by every pass over the simulators
+_connections = {}
+
+def get_connection(host, port):
+    conn = _connections.get((host, port))
+    if conn is None:
+        conn = _connections[(host, port)] = ModbusConn(host, port)
+    return conn
+
+def close_connections():
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
+
+atexit.register(close_connections)
+
+def read_modbus_registers(host, port, unit_id, start_reg, count):
+    """Read holding registers via Modbus TCP"""
+    try:
+        return get_connection(host, port).read_registers(unit_id, start_reg, count)
     except Exception as e:
         print(f"Error reading {host}:{port} - {e}")
         return None
 
+def plan_reads(requests):
+    """Merge overlapping or adjacent (start_reg, count) ranges into as few reads as possible"""
+    # Ranges too large for a single request are split at the protocol limit first
+    ranges = []
+    for start, count in requests:
+        while count > MAX_REGISTERS_PER_READ:
+            ranges.append((start, MAX_REGISTERS_PER_READ))
+            start += MAX_REGISTERS_PER_READ
+            count -= MAX_REGISTERS_PER_READ
+        ranges.append((start, count))
+
+    # Blocks in the plan never overlap: a range is clipped to start where the
+    # previous block ends, so no register is read (or returned) twice
+    plan = []
+    for start, count in sorted(ranges):
+        if plan:
+            prev_start, prev_count = plan[-1]
+            prev_end = prev_start + prev_count
+            if start < prev_end:
+                count -= prev_end - start
+                start = prev_end
+                if count <= 0:
+                    continue
+            if start == prev_end and prev_count + count <= MAX_REGISTERS_PER_READ:
+                plan[-1] = (prev_start, prev_count + count)
+                continue
+        plan.append((start, count))
+    return plan
+
+def batch_read(host, port, unit_id, requests):
+    """Read several register ranges with one pipelined request per merged range.
+
+    Returns a dict keyed by each original (start_reg, count) request, so
+    requests sharing a start register stay apart, or None if any of the
+    underlying reads failed.
+    """
+    plan = plan_reads(requests)
+    try:
+        # All merged ranges are requested in one pipelined round-trip
+        block_values = get_connection(host, port).read_many(unit_id, plan)
+    except Exception as e:
+        print(f"Error reading {host}:{port} - {e}")
+        return None
+
+    blocks = []
+    for (start, count), values in zip(plan, block_values):
+        if values is None or len(values) < count:
+            return None
+        blocks.append((start, values))
+
+    results = {}
+    for start, count in requests:
+        for block_start, values in blocks:
+            if block_start <= start and start + count <= block_start + len(values):
+                offset = start - block_start
+                results[start, count] = values[offset:offset + count]
+                break
+        else:
+            # Request was split across blocks; stitch it back together
+            results[start, count] = [
+                value
+                for block_start, values in blocks
+                for reg, value in enumerate(values, block_start)
+                if start <= reg < start + count
+            ]
+        if len(results[start, count]) != count:
+            return None
+    return results
+
 def combine_32bit_counter(high_reg, low_reg):
     """Combine two 16-bit registers into 32-bit counter"""
     return (high_reg << 16) | low_reg
 
+def decode_counters(registers):
+    """Combine (low word, high word) register pairs into 32-bit counter values"""
+    return [combine_32bit_counter(high, low) for low, high in zip(registers[0::2], registers[1::2])]
+
+def read_counters(host, port):
+    """Read all configured counter channels from one device in a single batch"""
+    # Each counter is 2 registers (low word, high word); adjacent channels
+    # are coalesced into a single read by batch_read
+    return batch_read(host, port, 1, [(channel * 2, 2) for channel, _ in CHANNELS])
+
+# Raw registers and decoded counters from the previous pass, per device
+last_readings = {}
+
+def print_counters(host, port, device_id, readings):
+    print(f"\n{device_id} ({host}:{port}):")
+
+    if not readings:
+        print("  Failed to read registers")
+        return
+
+    raw = tuple(value for channel, _ in CHANNELS for value in readings[channel * 2, 2])
+    previous = last_readings.get(device_id)
+
+    if previous is None:
+        counters = decode_counters(raw)
+        print(f"  Raw registers: {list(raw)}")
+        for (channel, name), counter in zip(CHANNELS, counters):
+            print(f"  Channel {channel} ({name}): {counter}")
+    elif raw == previous[0]:
+        # Idle device: nothing to decode or print
+        print("  (no change)")
+        return
+    else:
+        # Only recombine and report the channels whose register pair moved
+        previous_raw, previous_counters = previous
+        counters = list(previous_counters)
+        print(f"  Raw registers: {list(raw)}")
+        for index, (channel, name) in enumerate(CHANNELS):
+            low, high = raw[index * 2:index * 2 + 2]
+            if (low, high) == previous_raw[index * 2:index * 2 + 2]:
+                continue
+            counters[index] = combine_32bit_counter(high, low)
+            delta = counters[index] - previous_counters[index]
+            print(f"  Channel {channel} ({name}): {counters[index]} (Δ{delta:+d})")
+
+    last_readings[device_id] = (raw, counters)
+
+def poll_simulators(executor, simulators):
+    """Poll every simulator in parallel so a pass takes one device round-trip, not N"""
+    # Each device's blocking reads run in a worker thread on its own persistent
+    # connection (the GIL is released while waiting on the socket); results
+    # come back in simulator order
+    return executor.map(lambda sim: read_counters(sim[0], sim[1]), simulators)
+
+def report_simulators(executor, simulators):
+    for (host, port, device_id), readings in zip(simulators, poll_simulators(executor, simulators)):
+        print_counters(host, port, device_id, readings)
+
 print("Checking simulator register values...")
 print("=" * 50)
 
@@ -59,47 +277,14 @@ simulators = [
     ("localhost", 5504, "SIM-6051-03")
 ]
 
-for host, port, device_id in simulators:
-    print(f"\n{device_id} ({host}:{port}):")
-    
-    # Read first 4 registers (2 counters × 2 registers each)
-    regs = read_modbus_registers(host, port, 1, 0, 4)
-    
-    if regs:
-        print(f"  Raw registers: {regs}")
-        
-        # Channel 0 (registers 0-1)
-        if len(regs) >= 2:
-            counter0 = combine_32bit_counter(regs[1], regs[0])  # High, Low
-            print(f"  Channel 0 (MainProductCounter): {counter0}")
-        
-        # Channel 1 (registers 2-3)
-        if len(regs) >= 4:
-            counter1 = combine_32bit_counter(regs[3], regs[2])  # High, Low
-            print(f"  Channel 1 (RejectCounter): {counter1}")
-    else:
-        print("  Failed to read registers")
+# One pool shared by both passes, one worker per simulator
+with ThreadPoolExecutor(max_workers=len(simulators)) as executor:
+    report_simulators(executor, simulators)
 
-print("\nWaiting 5 seconds and checking again for changes...")
-time.sleep(5)
+    print("\nWaiting 5 seconds and checking again for changes...")
+    time.sleep(5)
 
-print("\n" + "=" * 50)
-print("Second reading (5 seconds later):")
+    print("\n" + "=" * 50)
+    print("Second reading (5 seconds later):")
 
-for host, port, device_id in simulators:
-    print(f"\n{device_id} ({host}:{port}):")
-    
-    regs = read_modbus_registers(host, port, 1, 0, 4)
-    
-    if regs:
-        print(f"  Raw registers: {regs}")
-        
-        if len(regs) >= 2:
-            counter0 = combine_32bit_counter(regs[1], regs[0])
-            print(f"  Channel 0 (MainProductCounter): {counter0}")
-        
-        if len(regs) >= 4:
-            counter1 = combine_32bit_counter(regs[3], regs[2])
-            print(f"  Channel 1 (RejectCounter): {counter1}")
-    else:
-        print("  Failed to read registers")
\ No newline at end of file
+    report_simulators(executor, simulators)
@@ -0,0 +1,69 @@
+"""
+Raw-socket Modbus TCP helpers shared by the test scripts in this directory
+"""
+
+import functools
+import select
+import socket
+import struct
+import time
+
+# Precompiled Modbus TCP formats: full FC03 request, MBAP header + function code, 16-bit word
+REQ = struct.Struct('>HHHBBHH')
+HDR = struct.Struct('>HHHBB')
+U16 = struct.Struct('>H')
+
+# Largest Modbus TCP frame: 7-byte MBAP header + 253-byte PDU
+MAX_ADU_SIZE = 260
+
+@functools.lru_cache(maxsize=None)
+def register_struct(count):
+    """Compiled big-endian format for `count` 16-bit registers (counts repeat, so cache them)"""
+    return struct.Struct(f'>{count}H')
+
+def tune_socket(sock):
+    """Socket options for polling with small requests and small replies"""
+    # Requests are only 12 bytes; send them immediately rather than letting Nagle hold them
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Let the OS notice a device that silently went away
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # A reply never exceeds MAX_ADU_SIZE, so a large receive buffer buys nothing
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8192)
+
+def quickack(sock):
+    """Ask Linux to ACK the next reply immediately instead of delaying the ACK"""
+    # The kernel drops back to delayed ACKs on its own, so re-arm before each request
+    if hasattr(socket, 'TCP_QUICKACK'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+def recvall(sock, n, buf, deadline):
+    """Receive exactly n bytes into buf, looping over short TCP reads.
+
+    Every wait is bounded by the same absolute `deadline` (time.monotonic()),
+    so a frame arriving in pieces cannot restart the timeout on each piece.
+    """
+    got = 0
+    while got < n:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+            raise TimeoutError("Timed out waiting for Modbus response")
+        k = sock.recv_into(buf[got:], n - got)
+        if not k:
+            raise ConnectionError("Connection closed by device")
+        got += k
+
+def read_frame(sock, rx, deadline):
+    """Read exactly one Modbus TCP frame (7-byte MBAP header + PDU) from the socket by `deadline`.
+
+    The frame is read into the preallocated memoryview `rx` and a view of it
+    is returned, so it is only valid until the next read into the same buffer.
+    """
+    recvall(sock, 7, rx, deadline)
+    # The MBAP length field counts the unit ID (already read) plus the PDU; the
+    # shortest PDU is a function code and one byte, the longest fills MAX_ADU_SIZE
+    protocol_id = U16.unpack_from(rx, 2)[0]
+    length = U16.unpack_from(rx, 4)[0]
+    if protocol_id != 0 or not 3 <= length <= MAX_ADU_SIZE - 6:
+        raise ConnectionError(f"Invalid MBAP header: protocol {protocol_id}, length {length}")
+    recvall(sock, length - 1, rx[7:], deadline)
+    return rx[:6 + length]
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
 import socket
-import struct
 import time
+from modbus_raw import REQ, HDR, MAX_ADU_SIZE, register_struct, tune_socket, quickack, read_frame
+
+# Receive buffer reused for every response instead of allocating one per read;
+# frames are read by their MBAP length, so it never needs to exceed one frame
+_RX = bytearray(MAX_ADU_SIZE)
+_RX_MV = memoryview(_RX)
 
 def simple_modbus_test(host, port):
     print(f"Simple Modbus test to {host}:{port}")
@@ -10,6 +15,7 @@ def simple_modbus_test(host, port):
     try:
         # Create socket connection
         sock = socket.create_connection((host, port), timeout=5)
+        tune_socket(sock)
         print("TCP connection established")
         
         # Build basic Modbus TCP request
@@ -23,39 +29,36 @@ def simple_modbus_test(host, port):
         num_registers = 2
         
         # Pack the request
-        request = struct.pack('>HHHBBHH', 
-                             transaction_id, protocol_id, length, 
-                             unit_id, function_code, start_address, num_registers)
+        request = REQ.pack(transaction_id, protocol_id, length,
+                           unit_id, function_code, start_address, num_registers)
         
         print(f"Sending request: {request.hex()}")
         
         # Send request and measure response time
         start_time = time.time()
+        quickack(sock)
         sock.send(request)
         
-        # Wait for response with timeout
-        sock.settimeout(3.0)
-        response = sock.recv(1024)
+        # Wait for response, 3s budget for the whole frame
+        response = read_frame(sock, _RX_MV, time.monotonic() + 3.0)
         response_time = time.time() - start_time
         
         print(f"Response received in {response_time:.3f}s: {response.hex()}")
         
         if len(response) >= 9:  # Minimum expected response length
             # Parse response header
-            resp_trans_id, resp_proto_id, resp_length, resp_unit_id, resp_func_code = struct.unpack('>HHHBB', response[:8])
+            resp_trans_id, resp_proto_id, resp_length, resp_unit_id, resp_func_code = HDR.unpack_from(response)
             print(f"Response parsed - Trans ID: {resp_trans_id}, Unit: {resp_unit_id}, Function: {resp_func_code}")
             
             if resp_func_code == function_code:
                 byte_count = response[8]
                 print(f"Data byte count: {byte_count}")
                 if len(response) >= 9 + byte_count:
-                    data = response[9:9+byte_count]
+                    data = response[9:9+byte_count]  # zero-copy view into the receive buffer
                     print(f"Register data: {data.hex()}")
                     # Parse as 16-bit registers
-                    registers = []
-                    for i in range(0, len(data), 2):
-                        reg_value = struct.unpack('>H', data[i:i+2])[0]
-                        registers.append(reg_value)
+                    n = byte_count // 2
+                    registers = list(register_struct(n).unpack(data[:2 * n]))
                     print(f"Register values: {registers}")
                     return True
             else:
@@ -4,32 +4,34 @@ Simple Modbus TCP connection test to verify simulator connectivity
 Tests direct connection to adam-simulator-1 on port 5502
 """
 
+import functools
 import socket
-import struct
 import time
 import sys
+from modbus_raw import REQ, HDR, U16, MAX_ADU_SIZE, register_struct, tune_socket, quickack, read_frame
 
-def create_modbus_read_request(unit_id=1, start_address=0, register_count=2):
+# Receive buffer reused for every response instead of allocating one per read;
+# frames are read by their MBAP length, so it never needs to exceed one frame
+_RX = bytearray(MAX_ADU_SIZE)
+_RX_MV = memoryview(_RX)
+
+def create_modbus_read_request(unit_id=1, start_address=0, register_count=2, transaction_id=0x0001):
     """Create a Modbus TCP read holding registers request"""
     # Modbus TCP header
-    transaction_id = 0x0001
     protocol_id = 0x0000
     length = 6  # Unit ID + Function Code + Start Address + Register Count
     
     # Modbus PDU
     function_code = 0x03  # Read Holding Registers
     
-    # Pack the request
-    request = struct.pack('>HHHBHH', 
-                         transaction_id,
-                         protocol_id, 
-                         length,
-                         unit_id,
-                         function_code,
-                         start_address)
-    request += struct.pack('>H', register_count)
-    
-    return request
+    # Pack the request (MBAP header + 1-byte function code + start address + count)
+    return REQ.pack(transaction_id,
+                     protocol_id,
+                     length,
+                     unit_id,
+                     function_code,
+                     start_address,
+                     register_count)
 
 def parse_modbus_response(response):
     """Parse a Modbus TCP response"""
@@ -37,7 +39,7 @@ def parse_modbus_response(response):
         return None, f"Response too short: {len(response)} bytes"
     
     # Parse header
-    transaction_id, protocol_id, length, unit_id, function_code = struct.unpack('>HHHBB', response[:8])
+    transaction_id, protocol_id, length, unit_id, function_code = HDR.unpack_from(response)
     
     if function_code & 0x80:  # Error response
         error_code = response[8]
@@ -48,54 +50,75 @@ def parse_modbus_response(response):
         if len(response) < 9 + byte_count:
             return None, "Incomplete response data"
         
-        registers = []
-        for i in range(0, byte_count, 2):
-            reg_value = struct.unpack('>H', response[9 + i:11 + i])[0]
-            registers.append(reg_value)
+        n = byte_count // 2
+        # Unpack straight from a memoryview so the payload is not copied
+        registers = list(register_struct(n).unpack(memoryview(response)[9:9 + 2 * n]))
         
         return registers, None
     
     return None, f"Unexpected function code: {function_code}"
 
+@functools.lru_cache(maxsize=None)
+def resolve(host, port):
+    """Resolve the simulator address once; every later connection reuses it"""
+    return socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_STREAM)[0]
+
+def open_sock(host, port):
+    """Open a TCP connection to the simulator"""
+    family, type_, proto, _, sockaddr = resolve(host, port)
+    sock = socket.socket(family, type_, proto)
+    sock.settimeout(5.0)
+    tune_socket(sock)
+    
+    print(f"Connecting to {host}:{port}...")
+    sock.connect(sockaddr)
+    print("TCP connection established")
+    
+    return sock
+
+def probe(sock, unit_id, transaction_id=1):
+    """Read the channel 0 counter from one Unit ID over an already open connection"""
+    # Test reading registers 0-1 (32-bit counter for channel 0)
+    print("Reading holding registers 0-1...")
+    request = create_modbus_read_request(unit_id, 0, 2, transaction_id)
+    
+    print(f"Sending request: {request.hex()}")
+    quickack(sock)
+    sock.send(request)
+    
+    # Receive response
+    response = read_frame(sock, _RX_MV, time.monotonic() + 5.0)
+    print(f"Received response: {response.hex()}")
+    
+    # The connection is shared between probes, so make sure this is our reply.
+    # A mismatch means a stale frame is queued on the socket; raise so the
+    # caller drops the connection instead of reading it as the next answer.
+    resp_transaction_id = U16.unpack_from(response)[0]
+    if resp_transaction_id != transaction_id:
+        raise ConnectionError(f"Unexpected transaction ID: {resp_transaction_id} (expected {transaction_id})")
+    
+    # Parse response
+    registers, error = parse_modbus_response(response)
+    if error:
+        print(f"Error parsing response: {error}")
+        return False
+    
+    print(f"Successfully read registers: {registers}")
+    
+    # Convert to 32-bit counter value (low word, high word)
+    if len(registers) >= 2:
+        counter_value = registers[1] << 16 | registers[0]
+        print(f"Channel 0 counter value: {counter_value}")
+    
+    return True
+
 def test_modbus_connection(host='adam-simulator-1', port=5502, unit_id=1):
     """Test Modbus TCP connection to simulator"""
     print(f"Testing Modbus connection to {host}:{port} (Unit ID: {unit_id})")
     
     try:
-        # Create socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5.0)
-        
-        print(f"Connecting to {host}:{port}...")
-        sock.connect((host, port))
-        print("TCP connection established")
-        
-        # Test reading registers 0-1 (32-bit counter for channel 0)
-        print("Reading holding registers 0-1...")
-        request = create_modbus_read_request(unit_id, 0, 2)
-        
-        print(f"Sending request: {request.hex()}")
-        sock.send(request)
-        
-        # Receive response
-        response = sock.recv(1024)
-        print(f"Received response: {response.hex()}")
-        
-        # Parse response
-        registers, error = parse_modbus_response(response)
-        if error:
-            print(f"Error parsing response: {error}")
-            return False
-        
-        print(f"Successfully read registers: {registers}")
-        
-        # Convert to 32-bit counter value (low word, high word)
-        if len(registers) >= 2:
-            counter_value = registers[1] << 16 | registers[0]
-            print(f"Channel 0 counter value: {counter_value}")
-        
-        sock.close()
-        return True
+        sock = open_sock(host, port)
+        return probe(sock, unit_id)
         
     except socket.timeout:
         print("Connection timeout")
@@ -119,13 +142,31 @@ def test_multiple_unit_ids(host='adam-simulator-1', port=5502):
     """Test different Unit IDs to see which one the simulator responds to"""
     print(f"\nTesting different Unit IDs on {host}:{port}:")
     
-    for unit_id in [0, 1, 2, 255]:
-        print(f"\n--- Testing Unit ID {unit_id} ---")
-        success = test_modbus_connection(host, port, unit_id)
-        if success:
-            print(f"✓ Unit ID {unit_id} works!")
-        else:
-            print(f"✗ Unit ID {unit_id} failed")
+    # The Unit ID travels in the MBAP header, so one connection can probe them all
+    sock = None
+    try:
+        for transaction_id, unit_id in enumerate([0, 1, 2, 255], start=1):
+            print(f"\n--- Testing Unit ID {unit_id} ---")
+            try:
+                if sock is None:
+                    sock = open_sock(host, port)
+                success = probe(sock, unit_id, transaction_id)
+            except Exception as e:
+                print(f"Connection failed: {e}")
+                success = False
+                # A unit that timed out may still answer later, or already has (a
+                # transaction ID mismatch); start the next probe on a fresh connection
+                if sock is not None:
+                    sock.close()
+                    sock = None
+            
+            if success:
+                print(f"✓ Unit ID {unit_id} works!")
+            else:
+                print(f"✗ Unit ID {unit_id} failed")
+    finally:
+        if sock is not None:
+            sock.close()
 
 if __name__ == "__main__":
     print("=== Modbus Connection Test ===")
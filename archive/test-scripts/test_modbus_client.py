@@ -2,8 +2,10 @@
 """
 Simple Modbus TCP client to test the ADAM-6051 simulator
 """
+import struct
 import sys
 import time
+from modbus_raw import REQ, U16, MAX_ADU_SIZE, tune_socket, quickack, read_frame
 
 try:
     from pymodbus.client import ModbusTcpClient
@@ -12,6 +14,24 @@ except ImportError:
     print("Please install pymodbus: pip install pymodbus")
     sys.exit(1)
 
+# ADAM-6051 register map (see Adam6051RegisterMap in the simulator)
+COUNTER_START_ADDRESS = 0     # 32-bit counters, 2 registers per channel (0-31)
+DI_STATUS_START_ADDRESS = 32  # Digital input status, 1 register per channel (32-47)
+CHANNEL_COUNT = 16
+MONITORED_CHANNELS = 3
+
+# Precompiled format for the raw-socket monitor loop
+_MONITOR_REGS = struct.Struct(f'>{MONITORED_CHANNELS * 2}H')
+
+# Request and receive buffers reused for every monitor poll
+_BUF = bytearray(REQ.size)
+_RX = bytearray(MAX_ADU_SIZE)
+_RX_MV = memoryview(_RX)
+
+def decode_counters(registers):
+    """Combine (low word, high word) register pairs into 32-bit counter values"""
+    return [(high_word << 16) | low_word for low_word, high_word in zip(registers[0::2], registers[1::2])]
+
 def test_adam_simulator(host='localhost', port=5502):
     """Test the ADAM-6051 simulator"""
     print(f"Connecting to ADAM-6051 simulator at {host}:{port}")
@@ -25,49 +45,83 @@ def test_adam_simulator(host='localhost', port=5502):
             return
         
         print("Connected successfully!")
+        tune_socket(client.socket)
         
         # Read counter values (holding registers)
-        # ADAM-6051 has 16 channels, each counter is 32-bit (2 registers)
+        # ADAM-6051 has 16 channels, each counter is 32-bit (2 registers).
+        # Counters (0-31) and DI status (32-47) are contiguous in the register
+        # map, so a single request covers both.
         print("\nReading counter values:")
-        
-        for channel in range(16):
-            # Each counter uses 2 registers (32-bit value)
-            base_address = channel * 2
-            result = client.read_holding_registers(address=base_address, count=2, slave=1)
-            
-            if not result.isError():
-                # Combine the two 16-bit registers into a 32-bit counter value
-                low_word = result.registers[0]
-                high_word = result.registers[1]
-                counter_value = (high_word << 16) | low_word
-                print(f"Channel {channel}: {counter_value}")
-            else:
-                print(f"Channel {channel}: Error reading - {result}")
-        
-        # Read digital input status
-        print("\nReading digital input status:")
-        result = client.read_holding_registers(address=64, count=16, slave=1)
+        result = client.read_holding_registers(address=COUNTER_START_ADDRESS, count=DI_STATUS_START_ADDRESS + CHANNEL_COUNT - COUNTER_START_ADDRESS, slave=1)
         
         if not result.isError():
-            for i, status in enumerate(result.registers):
+            # Combine each pair of 16-bit registers into a 32-bit counter value
+            counters = decode_counters(result.registers[:CHANNEL_COUNT * 2])
+            for channel, counter_value in enumerate(counters):
+                print(f"Channel {channel}: {counter_value}")
+            
+            # Read digital input status
+            print("\nReading digital input status:")
+            di_offset = DI_STATUS_START_ADDRESS - COUNTER_START_ADDRESS
+            for i, status in enumerate(result.registers[di_offset:di_offset + CHANNEL_COUNT]):
                 print(f"DI Channel {i}: {'ON' if status else 'OFF'}")
         else:
-            print(f"Error reading DI status: {result}")
+            print(f"Error reading counters and DI status: {result}")
         
         # Monitor counter changes
         print("\nMonitoring counter changes (press Ctrl+C to stop):")
         previous_values = {}
+        previous_block = None
+        
+        # pymodbus handled connect and discovery; the monitor loop talks to its
+        # socket directly, skipping the library's per-call encode/decode layers.
+        # The request never changes apart from its transaction ID.
+        sock = client.socket
+        sock.settimeout(3.0)  # pymodbus may have left the socket non-blocking
+        transaction_id = 0
+        REQ.pack_into(_BUF, 0, transaction_id, 0, 6, 1, 3, COUNTER_START_ADDRESS, MONITORED_CHANNELS * 2)
         
         while True:
-            for channel in range(3):  # Monitor first 3 channels
-                base_address = channel * 2
-                result = client.read_holding_registers(address=base_address, count=2, slave=1)
+            # Monitor first 3 channels with one read of their 6 registers
+            transaction_id = (transaction_id + 1) & 0xFFFF
+            U16.pack_into(_BUF, 0, transaction_id)
+            try:
+                if sock is None:
+                    # Re-dial after a failed cycle so no stale or partial frame
+                    # is left queued to be mistaken for the next reply
+                    if not client.connect():
+                        raise ConnectionError("Failed to reconnect to Modbus server")
+                    sock = client.socket
+                    tune_socket(sock)
+                    sock.settimeout(3.0)
+                quickack(sock)
+                sock.send(_BUF)
+                response = read_frame(sock, _RX_MV, time.monotonic() + 3.0)
+                # A reply for another request means the stream is out of step
+                if U16.unpack_from(response)[0] != transaction_id or (
+                        not response[7] & 0x80 and len(response) != 9 + _MONITOR_REGS.size):
+                    raise ConnectionError(f"Unexpected response: {response.hex()}")
+            except OSError as e:
+                # TimeoutError and ConnectionError included: report, drop the
+                # connection and keep monitoring
+                print(f"Read failed: {e}")
+                client.close()
+                sock = None
+                time.sleep(1)
+                continue
+            
+            if response[7] & 0x80:
+                print(f"Modbus exception response: {response.hex()}")
+                time.sleep(1)
+                continue
+            registers = _MONITOR_REGS.unpack_from(response, 9)
+            
+            # Counters are idle between pulses most of the time; when none of the
+            # raw registers moved there is nothing to decode or print
+            if registers != previous_block:
+                previous_block = registers
                 
-                if not result.isError():
-                    low_word = result.registers[0]
-                    high_word = result.registers[1]
-                    counter_value = (high_word << 16) | low_word
-                    
+                for channel, counter_value in enumerate(decode_counters(registers)):
                     if channel not in previous_values:
                         previous_values[channel] = counter_value
                     